@@ -0,0 +1,317 @@
+"""Нагрузочный тест бота целиком: bot.py против фейкового Bot API (bench/fake_telegram.py).
+
+Запуск:
+    python bench/bench_load.py --users 200 --operators 5 --messages 10
+    python bench/bench_load.py --unlimited --json after.json --baseline before.json
+    python bench/bench_load.py --flood-rate 0.02 --topics-per-minute 20 --env DB_BACKEND=postgres --env DATABASE_URL=...
+
+bot.py запускается отдельным процессом (polling) с TELEGRAM_API_URL на фейковый сервер, временной БД
+и METRICS_PORT. Каждый пользователь открывает FAQ, нажимает «Нет моего вопроса», создает тикет,
+пишет сообщения и альбомы и закрывает тикет; операторы отвечают в случайные открытые топики.
+Каждый шаг ждет ответа бота, задержка меряется от отправки апдейта до соответствующего вызова
+Bot API. В конце печатает пропускную способность, p50/p95/p99 по видам событий и время в БД
+(из /metrics бота); --json сохраняет результат, --baseline сравнивает с прошлым.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram import FakeTelegram, add_server_args, serve  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_ID = 123456
+SUPPORT_CHAT_ID = -1009999
+USER_BASE = 10_000_000
+OPERATOR_BASE = 500
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Load:
+    """Генератор апдейтов: пользователи и операторы, задержки по видам событий"""
+
+    def __init__(self, fake: FakeTelegram, args):
+        self.fake, self.args = fake, args
+        self.loop = asyncio.get_running_loop()
+        self.message_ids: dict[int, int] = {}  # chat_id -> последний message_id в этом чате
+        self.callback_ids = iter(range(1, 10**9))
+        self.latency: dict[str, list[float]] = {}
+        self.lost: dict[str, int] = {}
+        self.users_done = 0
+        self.started = self.finished = 0.0
+
+    def next_message_id(self, chat_id: int) -> int:
+        self.message_ids[chat_id] = self.message_ids.get(chat_id, 0) + 1
+        return self.message_ids[chat_id]
+
+    @staticmethod
+    def user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, chat_id: int, from_id: int, topic_id: int | None = None, **fields) -> dict:
+        chat = {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"} if chat_id > 0 else \
+            {"id": chat_id, "type": "supergroup", "title": "Support", "is_forum": True}
+        msg = {"message_id": self.next_message_id(chat_id), "date": int(time.time()), "chat": chat, "from": self.user(from_id), **fields}
+        if topic_id: msg.update(message_thread_id=topic_id, is_topic_message=True)
+        return msg
+
+    async def step(self, kind: str, key: tuple, update: dict) -> bool:
+        """Отправляет апдейт и ждет ответа бота с ключом key"""
+        future = self.fake.expect(key)
+        sent = self.loop.time()
+        self.fake.push(update)
+        try:
+            answered = await asyncio.wait_for(future, self.args.timeout)
+        except asyncio.TimeoutError:
+            self.fake.waiters.pop(key, None)
+            self.lost[kind] = self.lost.get(kind, 0) + 1
+            return False
+        self.latency.setdefault(kind, []).append(answered - sent)
+        self.finished = self.loop.time()
+        return True
+
+    async def click(self, user_id: int, data: str, kind: str) -> bool:
+        callback_id = str(next(self.callback_ids))
+        menu = self.message(user_id, BOT_ID, text="menu")
+        menu["from"] = {"id": BOT_ID, "is_bot": True, "first_name": "Support"}
+        update = {"callback_query": {"id": callback_id, "from": self.user(user_id), "chat_instance": str(user_id), "message": menu, "data": data}}
+        return await self.step(kind, ("callback", callback_id), update)
+
+    async def say(self, user_id: int, kind: str) -> bool:
+        msg = self.message(user_id, user_id, text=f"сообщение {self.message_ids.get(user_id, 0) + 1}")
+        return await self.step(kind, ("copy", user_id, msg["message_id"]), {"message": msg})
+
+    async def album(self, user_id: int, size: int) -> bool:
+        group = f"{user_id}_{self.message_ids.get(user_id, 0)}"
+        items = []
+        for i in range(size):
+            file_id = f"photo_{group}_{i}"
+            items.append(self.message(user_id, user_id, media_group_id=group, caption="альбом" if i == 0 else None,
+                                      photo=[{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]))
+        future = self.fake.expect(("album", items[0]["photo"][0]["file_id"]))
+        sent = self.loop.time()
+        for msg in items:
+            self.fake.push({"message": msg})
+            await asyncio.sleep(0.02)  # Telegram присылает элементы альбома почти подряд
+        try:
+            answered = await asyncio.wait_for(future, self.args.timeout)
+        except asyncio.TimeoutError:
+            self.lost["album"] = self.lost.get("album", 0) + 1
+            return False
+        self.latency.setdefault("album", []).append(answered - sent)
+        self.finished = self.loop.time()
+        return True
+
+    async def think(self, rnd: random.Random):
+        if self.args.think_ms: await asyncio.sleep(rnd.expovariate(1000 / self.args.think_ms))
+
+    async def user_session(self, index: int):
+        rnd = random.Random(index)
+        user_id = USER_BASE + index
+        await asyncio.sleep(rnd.uniform(0, self.args.ramp))
+        await self.click(user_id, "faq_open", "faq_click")
+        await self.think(rnd)
+        await self.click(user_id, "faq_no_answer", "faq_click")
+        if await self.say(user_id, "new_ticket"):
+            for _ in range(self.args.messages - 1):
+                await self.think(rnd)
+                if rnd.random() < self.args.album_share: await self.album(user_id, rnd.randint(2, 4))
+                else: await self.say(user_id, "user_message")
+            await self.think(rnd)
+            topic = next((key for key, owner in self.fake.topics.items() if owner == user_id), None)
+            if topic: await self.step("close_ticket", ("close", *topic), {"callback_query": {
+                "id": str(next(self.callback_ids)), "from": self.user(user_id), "chat_instance": str(user_id),
+                "message": self.message(user_id, BOT_ID, text="ticket"), "data": "ticket_close"}})
+        self.users_done += 1
+
+    async def operator_session(self, index: int):
+        rnd = random.Random(-index - 1)
+        operator_id = OPERATOR_BASE + index
+        while self.users_done < self.args.users:
+            await self.think(rnd)
+            if not self.fake.topics:
+                await asyncio.sleep(0.05)
+                continue
+            chat_id, topic_id = rnd.choice(list(self.fake.topics))
+            msg = self.message(chat_id, operator_id, topic_id, text="ответ оператора")
+            key = ("copy", chat_id, msg["message_id"])
+            future = self.fake.expect(key)
+            sent = self.loop.time()
+            self.fake.push({"message": msg})
+            try:
+                answered = await asyncio.wait_for(future, self.args.timeout)
+            except asyncio.TimeoutError:
+                # Пользователь успел закрыть тикет — бот ответил оператору, а не переслал: это не потеря
+                if (chat_id, topic_id) in self.fake.topics: self.lost["operator_reply"] = self.lost.get("operator_reply", 0) + 1
+                continue
+            self.latency.setdefault("operator_reply", []).append(answered - sent)
+            self.finished = self.loop.time()
+
+    async def run(self):
+        self.started = self.loop.time()
+        await asyncio.gather(*(self.user_session(i) for i in range(self.args.users)),
+                             *(self.operator_session(i) for i in range(self.args.operators)))
+
+
+async def scrape_metrics(port: int) -> dict[str, dict[str, float]]:
+    """supportbot_db_seconds_{sum,count} по операциям из /metrics бота"""
+    ops: dict[str, dict[str, float]] = {}
+    try:
+        async with ClientSession() as session, session.get(f"http://127.0.0.1:{port}/metrics") as response:
+            text = await response.text()
+    except Exception as e:
+        print(f"Не удалось получить метрики бота: {e}")
+        return ops
+    for line in text.splitlines():
+        for suffix in ("_sum", "_count"):
+            prefix = f"supportbot_db_seconds{suffix}{{op=\""
+            if line.startswith(prefix):
+                op, value = line[len(prefix):].split("\"} ")
+                ops.setdefault(op, {})[suffix[1:]] = float(value)
+    return ops
+
+
+async def start_bot(args, api_port: int, metrics_port: int, workdir: str):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": f"{BOT_ID}:LOADTEST",
+        "SUPPORT_CHAT_ID": str(SUPPORT_CHAT_ID),
+        "ADMIN_IDS": "1",
+        "BOT_MODE": "polling",
+        "DB_PATH": os.path.join(workdir, "load.db"),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "METRICS_PORT": str(metrics_port),
+        "FLOOD_RATE": "0",  # Тест — не спам: антиспам не должен отбрасывать апдейты
+        "FLOOD_CALLBACK_RATE": "0",
+    })
+    if args.unlimited:
+        env.update({"SEND_GLOBAL_RATE": "1000000", "SEND_CHAT_RATE": "1000000", "SEND_CHAT_BURST": "1000000", "SEND_GROUP_PER_MINUTE": "0"})
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = open(os.path.join(workdir, "bot.log"), "wb")
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, "bot.py"), cwd=workdir, env=env, stdout=log, stderr=log)
+    return proc, log
+
+
+async def stop_bot(proc):
+    if proc.returncode is not None: return
+    proc.send_signal(signal.SIGINT)
+    try: await asyncio.wait_for(proc.wait(), 30)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+
+
+def report(load: Load, fake: FakeTelegram, db_ops: dict, args) -> dict:
+    elapsed = max(load.finished - load.started, 1e-9)
+    events = sum(len(v) for v in load.latency.values())
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+        "elapsed_s": elapsed,
+        "throughput": events / elapsed,
+        "latency": {kind: {"count": len(values), "lost": load.lost.get(kind, 0),
+                           "p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+                    for kind, values in sorted(load.latency.items())},
+        "db": {"seconds": sum(op.get("sum", 0.0) for op in db_ops.values()),
+               "calls": int(sum(op.get("count", 0) for op in db_ops.values())), "ops": db_ops},
+        "api_calls": dict(fake.calls),
+        "flooded": dict(fake.flooded),
+    }
+    for kind, lost in load.lost.items():
+        result["latency"].setdefault(kind, {"count": 0, "lost": lost, "p50": 0.0, "p95": 0.0, "p99": 0.0})
+    print(f"\n{events:,} событий за {elapsed:.2f} с — {result['throughput']:,.1f} событий/с "
+          f"(пользователей {args.users}, операторов {args.operators}, задержка API {args.latency_ms:g}±{args.jitter_ms:g} мс)")
+    print(f"{'событие':<16}{'кол-во':>8}{'потеряно':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for kind, row in result["latency"].items():
+        print(f"{kind:<16}{row['count']:>8}{row['lost']:>10}{row['p50'] * 1e3:>10.1f}{row['p95'] * 1e3:>10.1f}{row['p99'] * 1e3:>10.1f}")
+    db = result["db"]
+    print(f"\nБД: {db['calls']:,} запросов, {db['seconds'] * 1e3:,.1f} мс всего"
+          + (f", {db['seconds'] / events * 1e3:.2f} мс на событие" if events else ""))
+    for op, row in sorted(db_ops.items(), key=lambda item: -item[1].get("sum", 0.0))[:8]:
+        count = row.get("count", 0)
+        print(f"  {op:<22}{int(count):>8}{row.get('sum', 0.0) * 1e3:>10.1f} мс{(row.get('sum', 0.0) / count * 1e3 if count else 0):>8.2f} мс/запрос")
+    print(f"\nBot API: {sum(fake.calls.values()):,} вызовов, 429: {sum(fake.flooded.values())}")
+    return result
+
+
+def compare(result: dict, baseline: dict):
+    def delta(new: float, old: float) -> str:
+        return f"{(new / old - 1) * 100:+.1f}%" if old else "—"
+    print(f"\nСравнение с базой: пропускная способность {delta(result['throughput'], baseline['throughput'])}")
+    for kind, row in result["latency"].items():
+        old = baseline["latency"].get(kind)
+        if not old or not old["count"] or not row["count"]: continue
+        print(f"  {kind:<16} p50 {delta(row['p50'], old['p50']):>8}  p95 {delta(row['p95'], old['p95']):>8}  p99 {delta(row['p99'], old['p99']):>8}"
+              f"  потеряно {row['lost']} (было {old['lost']})")
+    print(f"  {'БД, мс всего':<16} {delta(result['db']['seconds'], baseline['db']['seconds']):>8}")
+
+
+async def run(args):
+    fake = FakeTelegram(args.latency_ms / 1000, args.jitter_ms / 1000, args.flood_rate, args.retry_after, args.topics_per_minute, bot_id=BOT_ID)
+    api_port, metrics_port = free_port(), free_port()
+    runner = await serve(fake, "127.0.0.1", api_port)
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    proc, log = await start_bot(args, api_port, metrics_port, workdir)
+    try:
+        ready = asyncio.ensure_future(fake.polling.wait())
+        exited = asyncio.ensure_future(proc.wait())
+        await asyncio.wait({ready, exited}, timeout=60, return_when=asyncio.FIRST_COMPLETED)
+        exited.cancel()
+        if not ready.done():
+            ready.cancel()
+            print(f"Бот не запустился, лог: {log.name}")
+            return
+        load = Load(fake, args)
+        await load.run()
+        db_ops = await scrape_metrics(metrics_port)
+    finally:
+        await stop_bot(proc)
+        log.close()
+        await runner.cleanup()
+    result = report(load, fake, db_ops, args)
+    print(f"Лог бота: {log.name}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: compare(result, json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--operators", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=10, help="Сообщений на пользователя, включая первое")
+    parser.add_argument("--album-share", type=float, default=0.2, help="Доля альбомов среди сообщений")
+    parser.add_argument("--think-ms", type=float, default=200, help="Средняя пауза между действиями")
+    parser.add_argument("--ramp", type=float, default=5, help="За сколько секунд подключаются все пользователи")
+    parser.add_argument("--timeout", type=float, default=30, help="Сколько ждать ответа бота на шаг")
+    parser.add_argument("--unlimited", action="store_true", help="Снять лимиты отправки бота (SEND_*), чтобы мерить сам бот")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Дополнительное окружение бота")
+    parser.add_argument("--json", help="Сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    add_server_args(parser)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Микробенчмарки хелперов БД и структур в памяти на разных объемах данных.
+
+Запуск:
+    python bench/bench_micro.py                                  # 10k, 100k, 1M строк
+    python bench/bench_micro.py --sizes 10000,100000 --json before.json
+    python bench/bench_micro.py --sizes 10000,100000 --baseline before.json --threshold 15
+
+Для каждого объема создается временная SQLite-БД (STORAGE.init_schema + массовая вставка):
+message_map и tickets — по N строк, banned_users — N/10, faq — N/1000 (не меньше 20).
+Замеряются хелперы бота (save_message_pair, get_topic_message_id/get_user_message_id из индекса
+и из БД, get_ticket_info, get_open_ticket_by_user, get_faq_list/get_faq_item, reindex_faq_sort,
+get_ban_info_db, загрузка реестра банов) и структуры в памяти: check_access (бан, админ, антифлуд),
+FLOOD_LIMITER, BANS, REPLY_INDEX. Быстрые операции в памяти меряются пачками по --batch вызовов.
+
+Печатает ops/s и p50/p95/p99 (мкс). --json сохраняет результат (с коммитом и версией Python)
+для сравнения между релизами; --baseline сравнивает с прошлым JSON и завершается с кодом 1,
+если p50 какой-либо операции вырос больше, чем на --threshold процентов.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram.types import Chat, Message, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+SUPPORT_CHAT_ID = -1001
+ADMIN_ID = 1
+CREATED_AT = "2024-01-01T00:00:00"
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def stats(timings: list[float]) -> dict:
+    """Времена одного вызова (с) -> ops/s и перцентили в мкс"""
+    mean = sum(timings) / len(timings)
+    return {"n": len(timings), "ops": 1 / mean if mean else 0.0, "mean_us": mean * 1e6,
+            "p50_us": percentile(timings, 0.5) * 1e6, "p95_us": percentile(timings, 0.95) * 1e6, "p99_us": percentile(timings, 0.99) * 1e6}
+
+
+async def time_calls(func, calls: list[tuple]) -> list[float]:
+    """Корутина на каждый вызов: время отдельного await"""
+    timings = []
+    for args in calls:
+        started = time.perf_counter()
+        await func(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def time_batches(func, calls: list[tuple], batch: int) -> list[float]:
+    """Синхронные операции: perf_counter дороже самой операции, поэтому время пачки / batch"""
+    timings = []
+    for start in range(0, len(calls), batch):
+        chunk = calls[start:start + batch]
+        started = time.perf_counter()
+        for args in chunk: func(*args)
+        timings.append((time.perf_counter() - started) / len(chunk))
+    return timings
+
+
+async def time_async_batches(func, calls: list[tuple], batch: int) -> list[float]:
+    timings = []
+    for start in range(0, len(calls), batch):
+        chunk = calls[start:start + batch]
+        started = time.perf_counter()
+        for args in chunk: await func(*args)
+        timings.append((time.perf_counter() - started) / len(chunk))
+    return timings
+
+
+def fill(path: str, size: int) -> dict:
+    """Массовая вставка в схему из init_schema: быстрее, чем через хелперы, и не влияет на замеры"""
+    rnd = random.Random(size)
+    users = max(10, size // 5)
+    conn = sqlite3.connect(path)
+    for start in range(0, size, 50000):
+        rows = range(start, min(start + 50000, size))
+        conn.executemany("INSERT INTO message_map (support_chat_id, topic_message_id, user_chat_id, user_message_id) VALUES (?, ?, ?, ?)",
+                         ((SUPPORT_CHAT_ID, i, 1 + i % users, i) for i in rows))
+        conn.executemany("INSERT INTO tickets (id, user_id, username, support_chat_id, topic_id, status, created_at, closed_at) VALUES (?, ?, ?, ?, ?, 'closed', ?, ?)",
+                         ((i + 1, u, f"user{u}", SUPPORT_CHAT_ID, 1000 + i + 1, CREATED_AT, CREATED_AT) for i in rows for u in (rnd.randint(1, users),)))
+    # Каждый десятый пользователь сейчас с открытым (последним) тикетом
+    conn.execute("UPDATE tickets SET status='open', closed_at=NULL WHERE id IN (SELECT MAX(id) FROM tickets WHERE user_id % 10 = 0 GROUP BY user_id)")
+    bans = size // 10
+    conn.executemany("INSERT INTO banned_users (user_id, reason, admin_id, banned_at) VALUES (?, 'spam', ?, ?)",
+                     ((10_000_000 + i, ADMIN_ID, CREATED_AT) for i in range(bans)))
+    faq = max(20, size // 1000)
+    conn.executemany("INSERT INTO faq (id, question, answer, created_at, updated_at, sort_order) VALUES (?, ?, ?, ?, ?, ?)",
+                     ((i, f"Вопрос {i}", f"<b>Ответ</b> {i} " * 20, CREATED_AT, CREATED_AT, rnd.randint(0, faq)) for i in range(1, faq + 1)))
+    conn.executemany("INSERT INTO faq_media (faq_id, file_id, type, created_at) VALUES (?, ?, 'photo', ?)",
+                     ((i, f"file{i}", CREATED_AT) for i in range(1, faq + 1)))
+    conn.commit()
+    conn.close()
+    return {"users": users, "bans": bans, "faq": faq}
+
+
+class BenchMessage(Message):
+    """Message без бота: ответы забаненным и предупреждения антифлуда никуда не уходят"""
+    async def answer(self, *args, **kwargs): return None
+    async def reply(self, *args, **kwargs): return None
+
+
+def bench_message(user_id: int, media_group_id: str | None = None) -> BenchMessage:
+    return BenchMessage.model_construct(message_id=1, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+                                        from_user=User(id=user_id, is_bot=False, first_name="bench"), media_group_id=media_group_id)
+
+
+async def bench_size(bot, size: int, args, workdir: str) -> dict:
+    path = os.path.join(workdir, f"bench_{size}.db")
+    bot.STORAGE = bot.SQLiteStorage(path, args.readers)
+    await bot.STORAGE.open()
+    await bot.STORAGE.init_schema()
+    await bot.STORAGE.close()
+    started = time.perf_counter()
+    data = fill(path, size)
+    print(f"\n{size:,} строк: данные за {time.perf_counter() - started:.1f} с "
+          f"(пользователей {data['users']:,}, банов {data['bans']:,}, FAQ {data['faq']})")
+
+    rnd = random.Random(7)
+    n = args.lookups
+    heavy = max(3, n // 100)  # Операции над всей таблицей (пересортировка FAQ, загрузка банов)
+    # Индекс ответов прогрет последними сообщениями, как у работающего бота; более старые — только в БД
+    bot.REPLY_INDEX = bot.ReplyIndex(bot.REPLY_INDEX_SIZE, bot.REPLY_INDEX_MAX_AGE)
+    recent = min(size // 2, bot.REPLY_INDEX.capacity)
+    for i in range(size - recent, size):
+        bot.REPLY_INDEX.add(bot.topic_key(SUPPORT_CHAT_ID, i), 1 + i % data["users"], i)
+    old = rnd.sample(range(size - recent), min(2 * n, size - recent))  # Промахи уникальны: найденное попадает в индекс
+    hot = [rnd.randrange(size - recent, size) for _ in range(n)]
+    uid = lambda msg: 1 + msg % data["users"]
+    user_ids = [(rnd.randint(1, data["users"]),) for _ in range(n)]
+    bot.MESSAGE_MAP = bot.MessageMapWriter(bot.MESSAGE_MAP_FLUSH_MS, bot.MESSAGE_MAP_FLUSH_ROWS)
+    new_pairs = [(SUPPORT_CHAT_ID, size + i, 1 + i % data["users"], size + i) for i in range(n)]
+
+    await bot.STORAGE.open()
+    results = {}
+    try:
+        def case(name: str, timings: list[float]):
+            results[name] = stats(timings)
+
+        # --- Хелперы БД ---
+        case("save_message_pair", await time_async_batches(bot.save_message_pair, new_pairs, args.batch))
+        await bot.MESSAGE_MAP.flush()
+        flushes = []
+        for start in range(0, n, bot.MESSAGE_MAP.flush_rows):  # Отложенная запись: одна транзакция на пачку
+            for topic_msg_id in range(size + n + start, size + n + min(start + bot.MESSAGE_MAP.flush_rows, n)):
+                bot.MESSAGE_MAP.add(bot.topic_key(SUPPORT_CHAT_ID, topic_msg_id), 1 + topic_msg_id % data["users"], topic_msg_id)
+            started = time.perf_counter()
+            await bot.MESSAGE_MAP.flush()
+            flushes.append(time.perf_counter() - started)
+        case("message_map_flush", flushes)
+        case("get_topic_message_id_index", await time_async_batches(bot.get_topic_message_id, [(SUPPORT_CHAT_ID, uid(m), m) for m in hot], args.batch))
+        case("get_topic_message_id_db", await time_calls(bot.get_topic_message_id, [(SUPPORT_CHAT_ID, uid(m), m) for m in old[:n]]))
+        case("get_user_message_id_index", await time_async_batches(bot.get_user_message_id, [(SUPPORT_CHAT_ID, m) for m in hot], args.batch))
+        case("get_user_message_id_db", await time_calls(bot.get_user_message_id, [(SUPPORT_CHAT_ID, m) for m in old[n:]] or [(SUPPORT_CHAT_ID, -1)]))
+        case("get_ticket_info", await time_calls(bot.get_ticket_info, [(SUPPORT_CHAT_ID, 1001 + rnd.randrange(size)) for _ in range(n)]))
+        case("get_open_ticket_by_user", await time_calls(bot.get_open_ticket_by_user, user_ids))
+        case("get_last_ticket_by_user", await time_calls(bot.get_last_ticket_by_user, user_ids))
+        case("get_faq_list", await time_calls(bot.get_faq_list, [()] * n))
+        case("get_faq_item", await time_calls(bot.get_faq_item, [(rnd.randint(1, data["faq"]),) for _ in range(n)]))
+        case("reindex_faq_sort", await time_calls(bot.reindex_faq_sort, [()] * heavy))
+        case("get_ban_info_db", await time_calls(bot.get_ban_info_db, [(10_000_000 + rnd.randrange(max(1, data["bans"])),) for _ in range(n)]))
+        case("bans_load", await time_calls(bot.BANS.load, [()] * heavy))
+
+        # --- Структуры в памяти ---
+        banned = [10_000_000 + rnd.randrange(max(1, data["bans"])) for _ in range(n)]
+        case("bans_contains_hit", time_batches(bot.BANS.__contains__, [(u,) for u in banned], args.batch))
+        case("bans_contains_miss", time_batches(bot.BANS.__contains__, user_ids, args.batch))
+        case("reply_index_user_message_id", time_batches(bot.REPLY_INDEX.user_message_id, [(bot.topic_key(SUPPORT_CHAT_ID, m),) for m in hot], args.batch))
+        case("reply_index_topic_message_id", time_batches(bot.REPLY_INDEX.topic_message_id, [(uid(m), m) for m in hot], args.batch))
+        case("reply_index_miss", time_batches(bot.REPLY_INDEX.topic_message_id, [(uid(m), -m - 1) for m in hot], args.batch))
+        case("reply_index_add", time_batches(bot.REPLY_INDEX.add, [(bot.topic_key(SUPPORT_CHAT_ID, size + 2 * n + i), i, size + 2 * n + i) for i in range(n)], args.batch))
+
+        # Антифлуд: реестр с бакетами всех пользователей, как после часа работы
+        bot.FLOOD_LIMITER = bot.FloodLimiter(bot.FLOOD_RATE or 0.5, bot.FLOOD_BURST, bot.FLOOD_CALLBACK_RATE, bot.FLOOD_CALLBACK_BURST)
+        for user in range(1, data["users"] + 1): bot.FLOOD_LIMITER.message(user)
+        case("flood_limiter_message", time_batches(bot.FLOOD_LIMITER.message, user_ids, args.batch))
+        flooder = data["users"] + 1
+        while bot.FLOOD_LIMITER.message(flooder) >= 0: pass  # Исчерпан и уже предупрежден — без задачи с предупреждением
+        case("check_access_banned", await time_async_batches(bot.check_access, [(bench_message(u),) for u in banned], args.batch))
+        case("check_access_admin", await time_async_batches(bot.check_access, [(bench_message(ADMIN_ID),)] * n, args.batch))
+        case("check_access_allowed", await time_async_batches(bot.check_access, [(bench_message(20_000_000 + i),) for i in range(n)], args.batch))
+        case("check_access_flooded", await time_async_batches(bot.check_access, [(bench_message(flooder),)] * n, args.batch))
+    finally:
+        await bot.STORAGE.close()
+        os.remove(path)
+
+    print(f"{'операция':<32}{'ops/s':>12}{'p50, мкс':>12}{'p95, мкс':>12}{'p99, мкс':>12}")
+    for name, row in results.items():
+        print(f"{name:<32}{row['ops']:>12,.0f}{row['p50_us']:>12.2f}{row['p95_us']:>12.2f}{row['p99_us']:>12.2f}")
+    return results
+
+
+def git_commit() -> str:
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return ""
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> int:
+    """Печатает изменение p50 и ops/s; возвращает число регрессий p50 выше порога"""
+    regressions = 0
+    print(f"\nСравнение с базой {baseline.get('commit') or '?'} (порог регрессии p50: +{threshold:.0f}%)")
+    for size, rows in result["results"].items():
+        old_rows = baseline["results"].get(size)
+        if not old_rows: continue
+        print(f"  {int(size):,} строк:")
+        for name, row in rows.items():
+            old = old_rows.get(name)
+            if not old or not old["p50_us"]: continue
+            change = (row["p50_us"] / old["p50_us"] - 1) * 100
+            mark = " <- регрессия" if change > threshold else ""
+            regressions += bool(mark)
+            print(f"    {name:<32} p50 {change:+7.1f}%  ops/s {(row['ops'] / old['ops'] - 1) * 100 if old['ops'] else 0:+7.1f}%{mark}")
+    return regressions
+
+
+async def run(args) -> int:
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)  # Логи открытия БД и банов не мешают таблицам
+    workdir = tempfile.mkdtemp(prefix="bench_micro_")
+    result = {"commit": git_commit(), "python": platform.python_version(), "created_at": datetime.utcnow().isoformat(),
+              "lookups": args.lookups, "batch": args.batch, "results": {}}
+    for size in args.sizes:
+        result["results"][str(size)] = await bench_size(bot, size, args, workdir)
+    os.rmdir(workdir)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if compare(result, json.load(f), args.threshold): return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[10_000, 100_000, 1_000_000],
+                        help="Объемы данных через запятую (строк в message_map и tickets)")
+    parser.add_argument("--lookups", type=int, default=2000, help="Вызовов на операцию")
+    parser.add_argument("--batch", type=int, default=100, help="Вызовов в пачке для быстрых операций")
+    parser.add_argument("--readers", type=int, default=2, help="Читателей SQLite (DB_READERS)")
+    parser.add_argument("--json", help="Сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=10, help="Допустимый рост p50, %%")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+    os.environ["SUPPORT_CHAT_ID"] = str(SUPPORT_CHAT_ID)
+    os.environ["ADMIN_IDS"] = str(ADMIN_ID)
+    os.environ["DB_BACKEND"] = "sqlite"  # Хранилище создается здесь явно
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
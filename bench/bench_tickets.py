@@ -0,0 +1,104 @@
+"""Бенчмарк поиска тикетов на большой истории: до и после индексов из STORAGE.init_schema().
+
+Запуск:
+    python bench/bench_tickets.py --tickets 1000000 --lookups 300
+
+Создает временную БД со старой схемой tickets (без индексов), заполняет ее историей,
+замеряет get_ticket_info / get_open_ticket_by_user / get_last_ticket_by_user,
+затем вызывает STORAGE.init_schema() (индексы + уникальный открытый тикет) и замеряет снова.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUPPORT_CHAT_ID = -1001
+sys.path.insert(0, ROOT)
+
+
+def fill_history(path: str, tickets: int, users: int):
+    """Схема tickets без индексов + история: у каждого юзера последний тикет может быть открыт"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tickets (id INTEGER PRIMARY KEY, user_id INTEGER, username TEXT, support_chat_id INTEGER, topic_id INTEGER, status TEXT, created_at TEXT, closed_at TEXT, operator_id INTEGER)")
+    rnd = random.Random(42)
+    last_by_user = {}
+    rows = []
+    for ticket_id in range(1, tickets + 1):
+        user_id = rnd.randint(1, users)
+        last_by_user[user_id] = ticket_id
+        rows.append((ticket_id, user_id, f"user{user_id}", SUPPORT_CHAT_ID, 1000 + ticket_id, "closed", "2024-01-01T00:00:00", "2024-01-01T01:00:00", None))
+        if len(rows) >= 50000:
+            conn.executemany("INSERT INTO tickets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            rows.clear()
+    conn.executemany("INSERT INTO tickets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    # Каждый десятый пользователь сейчас с открытым тикетом
+    open_ids = [(ticket_id,) for user_id, ticket_id in last_by_user.items() if user_id % 10 == 0]
+    conn.executemany("UPDATE tickets SET status='open', closed_at=NULL WHERE id=?", open_ids)
+    conn.commit()
+    conn.close()
+
+
+async def measure(bot, lookups: int, tickets: int, users: int) -> dict[str, float]:
+    """Среднее время одного вызова (мкс) для каждого хелпера"""
+    rnd = random.Random(7)
+    topics = [(bot.SUPPORT_CHAT_ID, 1000 + rnd.randint(1, tickets)) for _ in range(lookups)]
+    user_ids = [(rnd.randint(1, users),) for _ in range(lookups)]
+    cases = {
+        "get_ticket_info": (bot.get_ticket_info, topics),
+        "get_open_ticket_by_user": (bot.get_open_ticket_by_user, user_ids),
+        "get_last_ticket_by_user": (bot.get_last_ticket_by_user, user_ids),
+    }
+    result = {}
+    for name, (func, args) in cases.items():
+        started = time.perf_counter()
+        for arg in args: await func(*arg)
+        result[name] = (time.perf_counter() - started) / len(args) * 1e6
+    return result
+
+
+async def run(args):
+    import bot
+    await bot.STORAGE.open()
+    try:
+        before = await measure(bot, args.lookups, args.tickets, args.users)
+        started = time.perf_counter()
+        await bot.STORAGE.init_schema()
+        migration = time.perf_counter() - started
+        after = await measure(bot, args.lookups, args.tickets, args.users)
+    finally:
+        await bot.STORAGE.close()
+
+    print(f"\nТикетов: {args.tickets:,}, пользователей: {args.users:,}, запросов на хелпер: {args.lookups}")
+    print(f"init_schema (создание индексов): {migration:.2f} с\n")
+    print(f"{'хелпер':<26}{'до, мкс':>14}{'после, мкс':>14}{'ускорение':>12}")
+    for name in before:
+        print(f"{name:<26}{before[name]:>14.1f}{after[name]:>14.1f}{before[name] / after[name]:>11.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_tickets_") as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        os.environ["DB_PATH"] = db_path
+        os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+        os.environ["SUPPORT_CHAT_ID"] = str(SUPPORT_CHAT_ID)
+        os.environ["DB_BACKEND"] = "sqlite"
+
+        started = time.perf_counter()
+        fill_history(db_path, args.tickets, args.users)
+        print(f"История создана за {time.perf_counter() - started:.1f} с: {db_path}")
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Фейковый сервер Telegram Bot API для нагрузочных тестов без токена и живых пользователей.
+
+Запуск отдельно (для ручной проверки):
+    python bench/fake_telegram.py --port 8081 --latency-ms 30
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:FAKE SUPPORT_CHAT_ID=-100999 python bot.py
+
+Отвечает на методы, которые вызывает бот: getUpdates (long polling), sendMessage, copyMessage,
+sendMediaGroup, createForumTopic, editForumTopic, closeForumTopic, answerCallbackQuery и др.;
+остальные методы возвращают true. Задержка ответа — latency ± jitter; запросы в чаты (с chat_id)
+получают 429 с вероятностью flood_rate; создание топиков ограничено topics_per_minute
+(сверх лимита — 429, как у Telegram).
+
+Апдейты для бота кладутся через push(). Ответы бота, которые ждет нагрузочный тест, ловятся
+через expect(key): ключ ("copy", from_chat_id, message_id), ("album", file_id первого элемента),
+("callback", callback_query_id) или ("close", chat_id, topic_id); future получает время ответа.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+# Методы без отправки сообщений: на них не бывает 429 и задержки
+SERVICE_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setMyCommands", "getWebhookInfo", "close", "logOut"}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.03, jitter: float = 0.02, flood_rate: float = 0.0, retry_after: int = 1,
+                 topics_per_minute: int = 0, bot_id: int = 123456, seed: int = 1):
+        self.latency, self.jitter = latency, jitter
+        self.flood_rate, self.retry_after = flood_rate, retry_after
+        self.topics_per_minute = topics_per_minute
+        self.me = {"id": bot_id, "is_bot": True, "first_name": "Support", "username": "fake_support_bot"}
+        self.random = random.Random(seed)
+        self.updates: deque[dict] = deque()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1_000_000_000)  # Не пересекаются с ID сообщений, которые шлет тест
+        self.topic_ids = itertools.count(10_000)
+        self.new_updates = asyncio.Event()
+        self.polling = asyncio.Event()  # Бот сделал первый getUpdates — готов к нагрузке
+        self.waiters: dict[tuple, asyncio.Future] = {}
+        self.topics: dict[tuple[int, int], int] = {}  # (chat_id, topic_id) -> user_id открытых тикетов
+        self.topic_created: deque[float] = deque()
+        self.calls: Counter = Counter()
+        self.flooded: Counter = Counter()
+        self.methods = {
+            "getUpdates": self.get_updates,
+            "getMe": lambda params: self.me,
+            "getChat": self.get_chat,
+            "sendMessage": self.send_message,
+            "sendPhoto": self.send_message,
+            "sendVideo": self.send_message,
+            "sendDocument": self.send_message,
+            "forwardMessage": self.send_message,
+            "copyMessage": self.copy_message,
+            "sendMediaGroup": self.send_media_group,
+            "createForumTopic": self.create_forum_topic,
+            "editForumTopic": self.edit_forum_topic,
+            "closeForumTopic": self.close_forum_topic,
+            "answerCallbackQuery": self.answer_callback_query,
+        }
+
+    # --- Апдейты и ожидание ответов ---
+    def push(self, update: dict) -> int:
+        update_id = update["update_id"] = next(self.update_ids)
+        self.updates.append(update)
+        self.new_updates.set()
+        return update_id
+
+    def expect(self, key: tuple) -> asyncio.Future:
+        future = self.waiters[key] = asyncio.get_running_loop().create_future()
+        return future
+
+    def _resolve(self, key: tuple):
+        future = self.waiters.pop(key, None)
+        if future and not future.done(): future.set_result(asyncio.get_running_loop().time())
+
+    # --- HTTP ---
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {}
+        if request.can_read_body:
+            if request.content_type == "application/json": params = await request.json()
+            else: params = {key: parse_value(value) for key, value in (await request.post()).items() if isinstance(value, str)}
+        self.calls[method] += 1
+        if method not in SERVICE_METHODS:
+            if self.latency or self.jitter:
+                await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+            # Telegram ограничивает отправку в чаты: 429 только на запросы с chat_id
+            if self.flood_rate and "chat_id" in params and self.random.random() < self.flood_rate:
+                return self.too_many_requests(method, self.retry_after)
+        try:
+            result = self.methods.get(method, lambda params: True)(params)
+            if asyncio.iscoroutine(result): result = await result
+        except FloodLimit as e:
+            return self.too_many_requests(method, e.retry_after)
+        return web.json_response({"ok": True, "result": result})
+
+    def too_many_requests(self, method: str, retry_after: int) -> web.Response:
+        self.flooded[method] += 1
+        return web.json_response({"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                                  "parameters": {"retry_after": retry_after}}, status=429)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        return app
+
+    # --- Методы Bot API ---
+    async def get_updates(self, params: dict) -> list[dict]:
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset: self.updates.popleft()  # Подтвержденные
+        if not self.updates:
+            self.new_updates.clear()
+            try: await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError: pass
+        return list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+
+    def message(self, chat_id: int, topic_id: int | None = None, **fields) -> dict:
+        chat = {"id": chat_id, "type": "private"} if chat_id > 0 else {"id": chat_id, "type": "supergroup", "title": "Support", "is_forum": True}
+        msg = {"message_id": next(self.message_ids), "date": int(time.time()), "chat": chat, "from": self.me, **fields}
+        if topic_id: msg.update(message_thread_id=topic_id, is_topic_message=True)
+        return msg
+
+    def get_chat(self, params: dict) -> dict:
+        chat_id = params["chat_id"]
+        return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "accent_color_id": 0, "max_reaction_count": 11,
+                "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False, "unique_gifts": False, "premium_subscription": False}}
+
+    def send_message(self, params: dict) -> dict:
+        fields = {"text": params["text"]} if "text" in params else {}
+        return self.message(params["chat_id"], params.get("message_thread_id"), **fields)
+
+    def copy_message(self, params: dict) -> dict:
+        self._resolve(("copy", params["from_chat_id"], params["message_id"]))
+        return {"message_id": next(self.message_ids)}
+
+    def send_media_group(self, params: dict) -> list[dict]:
+        media = params["media"]
+        self._resolve(("album", media[0]["media"]))
+        return [self.message(params["chat_id"], params.get("message_thread_id")) for _ in media]
+
+    def create_forum_topic(self, params: dict) -> dict:
+        if self.topics_per_minute:
+            now = time.monotonic()
+            while self.topic_created and now - self.topic_created[0] >= 60: self.topic_created.popleft()
+            if len(self.topic_created) >= self.topics_per_minute:
+                raise FloodLimit(math.ceil(60 - (now - self.topic_created[0])))
+            self.topic_created.append(now)
+        return {"message_thread_id": next(self.topic_ids), "name": params["name"], "icon_color": 7322096}
+
+    def edit_forum_topic(self, params: dict) -> bool:
+        # Бот называет топик "🔴 #ID{тикет} — @{username} — {user_id}": так тест узнает, чей это тикет
+        user_id = str(params.get("name", "")).rsplit("— ", 1)[-1]
+        if user_id.isdigit(): self.topics[(params["chat_id"], params["message_thread_id"])] = int(user_id)
+        return True
+
+    def close_forum_topic(self, params: dict) -> bool:
+        key = (params["chat_id"], params["message_thread_id"])
+        self.topics.pop(key, None)
+        self._resolve(("close", *key))
+        return True
+
+    def answer_callback_query(self, params: dict) -> bool:
+        self._resolve(("callback", str(params["callback_query_id"])))
+        return True
+
+
+class FloodLimit(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+def parse_value(value: str):
+    """Поля формы aiogram: числа, true/false и JSON (reply_markup, media) приходят строками"""
+    if value[:1] in "[{-0123456789" or value in ("true", "false"):
+        try: return json.loads(value)
+        except ValueError: pass
+    return value
+
+
+async def serve(fake: FakeTelegram, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def run(args):
+    fake = FakeTelegram(args.latency_ms / 1000, args.jitter_ms / 1000, args.flood_rate, args.retry_after, args.topics_per_minute)
+    runner = await serve(fake, args.host, args.port)
+    print(f"Fake Bot API: http://{args.host}:{args.port} (Ctrl+C — остановить)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"вызовы: {dict(fake.calls)}; 429: {dict(fake.flooded)}")
+    finally:
+        await runner.cleanup()
+
+
+def add_server_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=30, help="Задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Разброс задержки (±)")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Доля запросов, получающих 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--topics-per-minute", type=int, default=0, help="Лимит создания топиков (0 — без лимита)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_server_args(parser)
+    try: asyncio.run(run(parser.parse_args()))
+    except KeyboardInterrupt: pass
+
+
+if __name__ == "__main__":
+    main()
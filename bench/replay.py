@@ -0,0 +1,233 @@
+"""Воспроизведение записанного потока апдейтов (RECORD_FILE) для регрессионных замеров.
+
+Запуск:
+    python bench/replay.py updates.jsonl.gz                  # в исходном темпе (1×)
+    python bench/replay.py updates.jsonl.gz --speed 10       # в 10 раз быстрее
+    python bench/replay.py updates.jsonl.gz --speed 0        # без пауз, как можно быстрее
+    python bench/replay.py updates.jsonl.gz --db snapshot.db --unlimited --json after.json --baseline before.json
+
+Бот импортируется в этот процесс с конфигурацией из записи (ID бота, группы, админы) и временной
+БД — пустой или копией --db (снимок рабочей БД на момент начала записи). Запросы к Bot API
+не уходят в сеть: их обрабатывает заглушка с ответами bench/fake_telegram.py.
+
+Печатает время по хендлерам (p50/p95/max) и расхождения в вызовах Bot API: для каждого апдейта
+сравниваются методы и чаты, записанные в проде, с тем, что бот вызвал при воспроизведении.
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram import FakeTelegram  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def load_recording(path: str) -> tuple[dict, list[dict], dict[int, Counter], dict[int, list[int]]]:
+    """Конфигурация первого запуска, апдейты по порядку, записанные вызовы и созданные топики по update_id"""
+    header, updates, calls, topics = {}, [], defaultdict(Counter), defaultdict(list)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try: record = json.loads(line)
+            except ValueError: break  # Обрезанный хвост, если бот упал не дописав файл
+            kind = record["kind"]
+            if kind == "start": header = header or record
+            elif kind == "update": updates.append(record)
+            elif kind == "call":
+                calls[record["update_id"]][(record["method"], record["chat_id"])] += 1
+                if "topic_id" in record: topics[record["update_id"]].append(record["topic_id"])
+    return header, updates, calls, topics
+
+
+def configure(header: dict, args, workdir: str):
+    """Окружение для import bot: как в записи, но с временной БД и без записи/метрик"""
+    db_path = os.path.join(workdir, "replay.db")
+    if args.db: shutil.copyfile(args.db, db_path)
+    os.environ.update({
+        "BOT_TOKEN": f"{header.get('bot_id', 123456)}:REPLAY",
+        "SUPPORT_CHAT_IDS": ",".join(str(chat_id) for chat_id in header.get("support_chat_ids", [-1001])),
+        "SUPPORT_CHAT_ID": str(header.get("support_chat_ids", [-1001])[0]),
+        "SUPPORT_ROUTING": header.get("support_routing", "hash"),
+        "ADMIN_IDS": ",".join(str(admin_id) for admin_id in header.get("admin_ids", [])),
+        "BOT_MODE": "polling",
+        "DB_BACKEND": "sqlite",
+        "DB_PATH": db_path,
+        "RECORD_FILE": "",
+        "METRICS_PORT": "0",
+    })
+    if args.unlimited:
+        os.environ.update({"SEND_GLOBAL_RATE": "1000000", "SEND_CHAT_RATE": "1000000", "SEND_CHAT_BURST": "1000000", "SEND_GROUP_PER_MINUTE": "0"})
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+class Replay:
+    def __init__(self, bot_module, fake: FakeTelegram, topics: dict[int, list[int]]):
+        self.bot = bot_module
+        self.fake = fake
+        self.topics = topics  # Топики из записи: createForumTopic апдейта вернет тот же ID
+        self.fake.topic_ids = itertools.count(2_000_000_000)  # Остальные — не пересекаясь с записанными
+        self.calls: dict[int, Counter] = defaultdict(Counter)
+        self.handlers: dict[str, list[float]] = defaultdict(list)
+        self.handler_errors: Counter = Counter()
+        self.update_errors = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        """Заглушка сессии: ответ как у фейкового сервера, вызов — в список для сравнения"""
+        name = method.__api_method__
+        update_id = self.bot.RECORDING_UPDATE.get()
+        if update_id is not None: self.calls[update_id][(name, getattr(method, "chat_id", None))] += 1
+        if self.fake.latency: await asyncio.sleep(self.fake.latency)
+        params = method.model_dump(exclude_none=True)
+        result = self.fake.methods.get(name, lambda params: True)(params)
+        if asyncio.iscoroutine(result): result = await result
+        if name == "createForumTopic" and self.topics.get(update_id): result["message_thread_id"] = self.topics[update_id].pop(0)
+        response = bot.session.check_response(bot, method, 200, json.dumps({"ok": True, "result": result}, default=str))
+        return response.result
+
+    async def timing(self, handler, event, data: dict):
+        """Внутренний middleware: время каждого хендлера"""
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.handler_errors[name] += 1
+            raise
+        finally:
+            self.handlers[name].append(time.perf_counter() - started)
+
+    async def feed(self, update):
+        self.bot.RECORDING_UPDATE.set(update.update_id)
+        try: await self.bot.dp.feed_update(self.bot.bot, update)
+        except Exception: self.update_errors += 1
+
+    async def run(self, records: list[dict], speed: float) -> float:
+        from aiogram.types import Update
+        loop = asyncio.get_running_loop()
+        tasks = []
+        base = records[0]["t"] if records else 0.0
+        started = loop.time()
+        for record in records:
+            if speed:
+                delay = (record["t"] - base) / speed - (loop.time() - started)
+                if delay > 0: await asyncio.sleep(delay)
+            update = Update.model_validate(record["update"], context={"bot": self.bot.bot})
+            tasks.append(asyncio.create_task(self.feed(update)))
+            await asyncio.sleep(0)  # Апдейты встают в очереди чатов в исходном порядке
+        await asyncio.gather(*tasks)
+        await self.bot.ALBUMS.drain()
+        return loop.time() - started
+
+
+def divergence(recorded: dict[int, Counter], replayed: dict[int, Counter], update_ids: list[int], examples: int) -> dict:
+    diverged = []
+    by_method: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    for update_id in update_ids:
+        old, new = recorded.get(update_id, Counter()), replayed.get(update_id, Counter())
+        for (method, _), count in old.items(): by_method[method][0] += count
+        for (method, _), count in new.items(): by_method[method][1] += count
+        if old != new:
+            diverged.append({"update_id": update_id,
+                             "missing": sorted(f"{method} → {chat_id}" for method, chat_id in (old - new).elements()),
+                             "extra": sorted(f"{method} → {chat_id}" for method, chat_id in (new - old).elements())})
+    return {"updates": len(update_ids), "diverged": len(diverged),
+            "methods": {method: {"recorded": counts[0], "replayed": counts[1]} for method, counts in sorted(by_method.items())},
+            "examples": diverged[:examples]}
+
+
+def report(replay: Replay, elapsed: float, updates: int, diff: dict, recorded_any: bool, speed: float) -> dict:
+    print(f"\n{updates:,} апдейтов за {elapsed:.2f} с — {updates / max(elapsed, 1e-9):,.1f} апдейтов/с"
+          + (f", ошибок: {replay.update_errors}" if replay.update_errors else ""))
+    print(f"{'хендлер':<28}{'кол-во':>8}{'ошибки':>8}{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}")
+    handlers = {}
+    for name, values in sorted(replay.handlers.items(), key=lambda item: -sum(item[1])):
+        row = handlers[name] = {"count": len(values), "errors": replay.handler_errors[name],
+                                "p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "max": max(values)}
+        print(f"{name:<28}{row['count']:>8}{row['errors']:>8}{row['p50'] * 1e3:>10.2f}{row['p95'] * 1e3:>10.2f}{row['max'] * 1e3:>10.2f}")
+
+    if not recorded_any:
+        print("\nВ записи нет вызовов Bot API — сравнивать не с чем")
+    else:
+        print(f"\nРасхождения в вызовах Bot API: {diff['diverged']} из {diff['updates']} апдейтов")
+        if speed == 0 and diff["diverged"]:
+            print("  (без пауз апдейты разных чатов обгоняют друг друга: ответ оператора может прийти раньше, чем создан тикет;\n"
+                  "   поведение сверяйте в исходном темпе, --speed 1)")
+        for method, row in diff["methods"].items():
+            mark = "" if row["recorded"] == row["replayed"] else "  ≠"
+            print(f"  {method:<26}{row['recorded']:>8} → {row['replayed']:<8}{mark}")
+        for example in diff["examples"]:
+            print(f"  update {example['update_id']}: нет {example['missing'] or '—'}, лишние {example['extra'] or '—'}")
+    return {"elapsed_s": elapsed, "updates": updates, "update_errors": replay.update_errors, "handlers": handlers, "divergence": diff}
+
+
+def compare(result: dict, baseline: dict):
+    def delta(new: float, old: float) -> str:
+        return f"{(new / old - 1) * 100:+.1f}%" if old else "—"
+    print("\nСравнение с базой:")
+    for name, row in result["handlers"].items():
+        old = baseline["handlers"].get(name)
+        if old: print(f"  {name:<28} p50 {delta(row['p50'], old['p50']):>8}  p95 {delta(row['p95'], old['p95']):>8}")
+    print(f"  расхождений: {result['divergence']['diverged']} (было {baseline['divergence']['diverged']})")
+
+
+async def run(args, records: list[dict], recorded: dict[int, Counter], topics: dict[int, list[int]]):
+    import bot as bot_module
+    fake = FakeTelegram(latency=args.latency_ms / 1000, jitter=0, bot_id=bot_module.bot.id)
+    replay = Replay(bot_module, fake, topics)
+    bot_module.bot.session.make_request = replay.make_request
+    bot_module.dp.message.middleware(replay.timing)
+    bot_module.dp.callback_query.middleware(replay.timing)
+    await bot_module.on_startup()
+    try:
+        elapsed = await replay.run(records, args.speed)
+    finally:
+        await bot_module.on_shutdown()
+    update_ids = [record["update"]["update_id"] for record in records]
+    diff = divergence(recorded, replay.calls, update_ids, args.examples)
+    result = report(replay, elapsed, len(records), diff, bool(recorded), args.speed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: compare(result, json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="Файл RECORD_FILE (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Темп относительно записи; 0 — без пауз")
+    parser.add_argument("--limit", type=int, default=0, help="Воспроизвести только первые N апдейтов")
+    parser.add_argument("--db", help="Снимок БД бота на момент начала записи (копируется)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Задержка ответа заглушки Bot API")
+    parser.add_argument("--unlimited", action="store_true", help="Снять лимиты отправки бота (SEND_*)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Дополнительное окружение бота")
+    parser.add_argument("--examples", type=int, default=10, help="Сколько расходящихся апдейтов показать")
+    parser.add_argument("--json", help="Сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого воспроизведения для сравнения")
+    args = parser.parse_args()
+
+    header, records, recorded, topics = load_recording(args.recording)
+    if args.limit: records = records[:args.limit]
+    if not records: sys.exit("В записи нет апдейтов")
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    configure(header, args, workdir)
+    sys.path.insert(0, ROOT)
+    asyncio.run(run(args, records, recorded, topics))
+
+
+if __name__ == "__main__":
+    main()